@@ -9,7 +9,13 @@ import urllib.parse
 from datetime import datetime, timedelta, timezone
 import FinanceDataReader as fdr
 import time
+from functools import partial
 from streamlit_autorefresh import st_autorefresh
+from history_store import append_history, backfill_history, carry_history, has_backfill, load_history, period_returns, drawdown
+from risk_analytics import compute_risk, holdings_hash
+from rollup import refresh_rollup, is_hidden_account, ROLLUP_DIMS
+from snapshot import workbook_hash, latest_snapshot, snapshot_exists, save_snapshot, load_snapshot, diff_snapshots
+from portfolio_export import EXPORT_FORMATS, build_export, export_file_info
 
 # -----------------------------------------------------------------------------
 # 1. 페이지 설정 및 세션 초기화
@@ -17,7 +23,8 @@ from streamlit_autorefresh import st_autorefresh
 st.set_page_config(page_title="Portfolio Manager", layout="wide", page_icon="🏦")
 
 # 5분(300초)마다 페이지 자동 새로고침
-refresh_count = st_autorefresh(interval=5 * 60 * 1000, key="data_refresh")
+REFRESH_MINUTES = 5
+refresh_count = st_autorefresh(interval=REFRESH_MINUTES * 60 * 1000, key="data_refresh")
 
 if 'portfolio_data' not in st.session_state:
     st.session_state['portfolio_data'] = None
@@ -48,6 +55,21 @@ if 'raw_excel_data' not in st.session_state:
 if 'uploaded_filename' not in st.session_state:
     st.session_state['uploaded_filename'] = None
 
+if 'rollup' not in st.session_state:
+    st.session_state['rollup'] = None
+
+if 'workbook_hash' not in st.session_state:
+    st.session_state['workbook_hash'] = None
+
+if 'price_ts' not in st.session_state:
+    st.session_state['price_ts'] = None
+
+if 'snapshot_name' not in st.session_state:
+    st.session_state['snapshot_name'] = None
+
+if 'prev_snapshot' not in st.session_state:
+    st.session_state['prev_snapshot'] = None
+
 # -----------------------------------------------------------------------------
 # 상단 타이틀 배너
 # -----------------------------------------------------------------------------
@@ -127,6 +149,94 @@ def get_hist_price(ticker, target_date, is_kr):
     except: pass
     return 0.0
 
+# [추가] 과거 종가 행렬 일괄 조회 (행=날짜, 열=종목코드, 현지통화)
+# 해외 종목과 국내 종목(.KS → .KQ 순) 모두 yf.download 일괄 조회, 남은 국내 종목만 FDR 종목별 조회
+@st.cache_data(ttl=3600*12)
+def get_hist_price_matrix(ticker_pairs, start_date, end_date):
+    start_str = start_date.strftime('%Y-%m-%d')
+    end_str = end_date.strftime('%Y-%m-%d')
+    end_yf_str = (end_date + timedelta(days=1)).strftime('%Y-%m-%d')
+    series = {}
+
+    kr_codes = {t: t.split('.')[0] for t, is_kr in ticker_pairs if is_kr}
+    us_tickers = [t for t, is_kr in ticker_pairs if not is_kr]
+
+    def download_close(symbols):
+        if not symbols: return pd.DataFrame()
+        try:
+            data = yf.download(symbols, start=start_str, end=end_yf_str, progress=False, auto_adjust=False, threads=True)
+            close = data['Close']
+            if isinstance(close, pd.Series): close = close.to_frame(symbols[0])
+            return close.dropna(axis=1, how='all')
+        except: return pd.DataFrame()
+
+    us_close = download_close(us_tickers)
+    for t in us_close.columns: series[t] = us_close[t]
+
+    for suffix in ['.KS', '.KQ']:
+        missing = {f"{c}{suffix}": t for t, c in kr_codes.items() if t not in series}
+        kr_close = download_close(list(missing))
+        for sym in kr_close.columns: series[missing[sym]] = kr_close[sym]
+
+    # 일괄 조회에 없는 국내 종목(신규 상장 등)만 FDR 로 종목별 재시도
+    for t, clean_code in kr_codes.items():
+        if t in series: continue
+        try:
+            df = fdr.DataReader(clean_code, start_str, end_str)
+            if not df.empty: series[t] = df['Close']
+        except: pass
+
+    if not series: return pd.DataFrame()
+    for t, s in series.items():
+        idx = pd.to_datetime(s.index)
+        series[t] = s.set_axis(idx.tz_localize(None) if idx.tz is not None else idx).astype(float)
+    return pd.DataFrame(series).sort_index().ffill()
+
+@st.cache_data(ttl=3600*12)
+def get_hist_fx_series(start_date, end_date):
+    try:
+        df = fdr.DataReader('USD/KRW', start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        if not df.empty: return df['Close'].astype(float)
+    except: pass
+    return pd.Series(dtype=float)
+
+# [추가] 베타 계산용 벤치마크 지수 (KOSPI: 원화, S&P 500: 달러)
+@st.cache_data(ttl=3600*12)
+def get_benchmark_prices(start_date, end_date):
+    start_str, end_str = start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+    benchmarks = {}
+    for name, fdr_sym, yf_sym, currency in [('KOSPI', 'KS11', '^KS11', 'KRW'), ('S&P 500', 'US500', '^GSPC', 'USD')]:
+        try:
+            df = fdr.DataReader(fdr_sym, start_str, end_str)
+            if not df.empty: benchmarks[name] = (df['Close'].astype(float), currency); continue
+        except: pass
+        try:
+            hist = yf.Ticker(yf_sym).history(start=start_str, end=(end_date + timedelta(days=1)).strftime('%Y-%m-%d'))
+            if not hist.empty: benchmarks[name] = (hist['Close'].tz_localize(None).astype(float), currency)
+        except: pass
+    return benchmarks
+
+# [추가] 보유 구성 해시 + 기준일 단위로 캐시 (_holdings 는 캐시 키에서 제외)
+@st.cache_data(ttl=3600*24, show_spinner=False)
+def get_portfolio_risk(holdings_key, as_of, _holdings):
+    start_d = as_of - timedelta(days=365)
+    matrix = get_hist_price_matrix(holdings_ticker_pairs(_holdings), start_d, as_of)
+    fx_series = get_hist_fx_series(start_d - timedelta(days=7), as_of)
+    return compute_risk(_holdings, matrix, fx_series, get_benchmark_prices(start_d, as_of))
+
+# [추가] 스냅샷은 내용이 바뀌지 않으므로 이름 기준으로 캐시
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_snapshot_cached(name):
+    return load_snapshot(name)
+
+def holdings_ticker_pairs(df):
+    pairs = []
+    for _, row in df.iterrows():
+        t = str(row['종목코드']).strip().upper()
+        if t in ['KRW', 'USD']: continue
+        pairs.append((t, (row.get('국가') == '한국') or is_korean_stock(t)))
+    return tuple(sorted(set(pairs)))
+
 @st.cache_data(ttl=3600*12)
 def get_korean_market_map():
     market_data = {}
@@ -315,11 +425,6 @@ def create_pie(data, names, title, value_col='평가금액'):
     )
     return fig
 
-def color_profit(val):
-    if val > 0: return 'color: #ff2b2b'
-    elif val < 0: return 'color: #00498c'
-    return 'color: black'
-
 # [수정] 스마트 포맷팅: 사용자가 USD 매수단가를 환율(1300 등)로 적었을 때 혼동 방지
 def format_price_smart(val, ticker, curr):
     if pd.isna(val): return ""
@@ -330,6 +435,43 @@ def format_price_smart(val, ticker, curr):
         return f"${val:,.2f}"
     return f"{val:,.0f} 원"
 
+# [추가] format_price_smart 와 같은 규칙을 열 단위로 적용 (행 단위 apply 제거)
+def format_price_column(vals, tickers, currs):
+    vals = pd.to_numeric(vals, errors='coerce').astype(float)
+    usd_cash_in_krw = tickers.astype(str).str.strip().str.upper().eq('USD') & (vals > 50)
+    as_usd = vals.notna() & currs.astype(str).eq('USD') & ~usd_cash_in_krw
+    as_krw = vals.notna() & ~as_usd
+    out = pd.Series('', index=vals.index, dtype=object)
+    out[as_usd] = vals[as_usd].map('${:,.2f}'.format)
+    out[as_krw] = vals[as_krw].map('{:,.0f} 원'.format)
+    return out
+
+# [추가] 보유 종목 표: 숫자 열은 숫자 그대로 두고 열 단위 포맷만 지정 (Styler 미사용)
+# (st.dataframe 는 행을 가상 스크롤하므로 일반적인 장부 크기는 한 표로 그대로 표시)
+TABLE_PAGE_SIZE = 20_000
+HOLDINGS_COLUMN_CONFIG = {
+    '수량': st.column_config.NumberColumn('수량', format='%,.2f'),
+    '수익률': st.column_config.NumberColumn('수익률', format='%+.2f%%'),
+    '평가금액': st.column_config.NumberColumn('평가금액', format='%,.0f'),
+}
+
+def render_holdings_table(df, cols, price_cols, key):
+    # 아주 큰 표만 페이지 단위로 잘라 현재 페이지만 포맷·직렬화
+    # (헤더 클릭 정렬은 현재 페이지 안에서만 적용되므로, 전체 정렬은 자르기 전에 적용)
+    n_pages = max((len(df) - 1) // TABLE_PAGE_SIZE + 1, 1)
+    if n_pages > 1:
+        p1, p2, p3 = st.columns([2, 1, 1])
+        sort_col = p1.selectbox("전체 정렬 기준", ['(원래 순서)'] + cols, key=f"{key}_sort")
+        ascending = p2.toggle("오름차순", value=False, key=f"{key}_asc")
+        page = p3.number_input(f"페이지 (총 {n_pages}쪽)", min_value=1, max_value=n_pages, value=1, step=1, key=f"{key}_page")
+        st.caption(f"{len(df):,}행이라 {TABLE_PAGE_SIZE:,}행씩 나눠 표시합니다. 표 머리글 클릭 정렬은 현재 페이지 안에서만 적용되니, 전체 정렬은 위 '전체 정렬 기준'을 사용하세요.")
+        if sort_col != '(원래 순서)': df = df.sort_values(sort_col, ascending=ascending, kind='stable')
+        df = df.iloc[(page - 1) * TABLE_PAGE_SIZE: page * TABLE_PAGE_SIZE]
+    disp = df[cols].copy()
+    for c in price_cols:
+        disp[c] = format_price_column(df[c], df['종목코드'], df['통화'])
+    st.dataframe(disp, column_config=HOLDINGS_COLUMN_CONFIG, use_container_width=True, hide_index=True, key=key)
+
 def calculate_portfolio(df, usd_krw):
     current_prices, eval_values, buy_values, currencies = [], [], [], []
     krx_map = get_korean_market_map()
@@ -394,6 +536,8 @@ def calculate_portfolio(df, usd_krw):
 # -----------------------------------------------------------------------------
 # 3. 엑셀 다운로드 및 PDF 로드 기능
 # -----------------------------------------------------------------------------
+# [수정] 정적 파일은 프로세스당 한 번만 생성/로드하고, 다운로드 버튼에는 함수를 넘겨 클릭 시에만 전달
+@st.cache_resource
 def get_template_excel():
     output = io.BytesIO()
     with pd.ExcelWriter(output, engine='openpyxl') as writer:
@@ -402,6 +546,7 @@ def get_template_excel():
         pd.DataFrame({'종목코드': ['005930', '0072R0'], '종목명': ['삼성전자', 'TIGER KRX금현물'], '업종': ['반도체', '원자재'], '국가': ['한국', '한국'], '수량': [100, 50], '매수단가': [60000, 12000], '납입원금': [6000000, 0]}).to_excel(writer, index=False, sheet_name='퇴직연금(IRP)')
     return output.getvalue()
 
+@st.cache_resource
 def get_guide_pdf():
     try:
         with open("포트폴리오 매니저_엑셀작성가이드.pdf", "rb") as f:
@@ -422,13 +567,13 @@ if st.session_state['portfolio_data'] is None and st.session_state['raw_excel_da
         st.info("💡 **Step 1.** 처음이신가요?\n\n엑셀 양식과 작성 가이드를 다운로드하여 보유 자산을 입력하세요.")
         st.download_button(
             label="📄 표준 엑셀 양식 다운로드", 
-            data=get_template_excel(), 
+            data=get_template_excel, 
             file_name='portfolio_template_v7.8.xlsx', 
             use_container_width=True
         )
         st.download_button(
             label="📥 엑셀 작성 가이드 (PDF)", 
-            data=get_guide_pdf(), 
+            data=get_guide_pdf, 
             file_name='포트폴리오 매니저_엑셀작성가이드.pdf', 
             mime='application/pdf',
             use_container_width=True
@@ -444,8 +589,8 @@ else:
         col_dl, col_up = st.columns([1, 1.5])
         with col_dl:
             st.markdown("**양식 및 가이드 다운로드**")
-            st.download_button("📄 표준 엑셀 양식 받기", data=get_template_excel(), file_name='portfolio_template_v7.8.xlsx', use_container_width=True)
-            st.download_button("📥 엑셀 작성 가이드 (PDF)", data=get_guide_pdf(), file_name='포트폴리오 매니저_엑셀작성가이드.pdf', mime='application/pdf', use_container_width=True)
+            st.download_button("📄 표준 엑셀 양식 받기", data=get_template_excel, file_name='portfolio_template_v7.8.xlsx', use_container_width=True)
+            st.download_button("📥 엑셀 작성 가이드 (PDF)", data=get_guide_pdf, file_name='포트폴리오 매니저_엑셀작성가이드.pdf', mime='application/pdf', use_container_width=True)
         with col_up:
             st.markdown("**데이터 재업로드**")
             uploaded_file = st.file_uploader("새로운 엑셀 파일 업로드", type=['xlsx'], label_visibility="collapsed")
@@ -454,10 +599,34 @@ else:
 # 파일 업로드 감지 로직
 # -----------------------------------------------------------------------------
 if uploaded_file is not None:
-    if st.session_state['uploaded_filename'] != uploaded_file.name:
+    # [수정] 파일명 대신 내용 해시로 변경 감지 (같은 이름의 수정본도 재계산)
+    wb_hash = workbook_hash(uploaded_file.getvalue())
+    if st.session_state['workbook_hash'] != wb_hash:
+        # [추가] 이 세션에서 교체되는 업로드의 스냅샷을 비교 대상으로 기록
+        if st.session_state['snapshot_name']:
+            st.session_state['prev_snapshot'] = st.session_state['snapshot_name']
+        st.session_state['snapshot_name'] = None
+        # [추가] 수정본 재업로드: 이전 통합문서의 히스토리를 이어받음 (내용 해시가 바뀌어도 시계열 유지)
+        if st.session_state['workbook_hash']:
+            try: carry_history(st.session_state['workbook_hash'], wb_hash)
+            except Exception as e: st.toast(f"히스토리 이어받기 실패: {e}")
         st.session_state['raw_excel_data'] = pd.read_excel(uploaded_file, sheet_name=None)
         st.session_state['uploaded_filename'] = uploaded_file.name
+        st.session_state['workbook_hash'] = wb_hash
         st.session_state['portfolio_data'] = None 
+        # [추가] 같은 통합문서의 스냅샷이 자동 새로고침 주기 이내 시세면 재계산 없이 바로 불러옴
+        snap_name = latest_snapshot(wb_hash, since=now_kst.replace(tzinfo=None) - timedelta(minutes=REFRESH_MINUTES))
+        if snap_name:
+            try:
+                snap_data, snap_meta = load_snapshot(snap_name)
+                st.session_state['portfolio_data'] = snap_data
+                st.session_state['usd_krw'] = snap_meta['usd_krw']
+                st.session_state['price_ts'] = snap_meta['price_ts']
+                st.session_state['snapshot_name'] = snap_name
+                st.session_state['rollup'] = refresh_rollup(st.session_state['rollup'], pd.concat(snap_data.values(), ignore_index=True))
+                for k, v in snap_meta.get('excel_principals', {}).items(): st.session_state['user_principals'][k] = v
+            except:
+                st.session_state['portfolio_data'] = None
         st.rerun()
 
 if st.session_state['raw_excel_data'] is not None:
@@ -484,19 +653,36 @@ if st.session_state['raw_excel_data'] is not None:
             
             if not processed_data: st.error("데이터를 읽을 수 없습니다."); st.stop()
             st.session_state['portfolio_data'] = processed_data
+            # [추가] 배분 롤업: 이전 롤업이 있으면 바뀐 행만 반영
+            st.session_state['rollup'] = refresh_rollup(st.session_state['rollup'], pd.concat(processed_data.values(), ignore_index=True))
+            # [추가] 계좌별 일별 평가금액 히스토리 기록 (거래일당 1행)
+            for sheet_name, processed_df in processed_data.items():
+                try: append_history(st.session_state['workbook_hash'], sheet_name, processed_df, now_kst.date())
+                except Exception as e: st.warning(f"'{sheet_name}' 히스토리 저장 실패: {e}")
             st.session_state['usd_krw'] = usd_krw
+            st.session_state['price_ts'] = now_kst.isoformat()
             if excel_principals:
                 for k, v in excel_principals.items(): st.session_state['user_principals'][k] = v
+            # [추가] 평가 결과 스냅샷 저장 (통합문서 해시 + 시세 시각)
+            if st.session_state['workbook_hash']:
+                try: st.session_state['snapshot_name'] = save_snapshot(st.session_state['workbook_hash'], processed_data, now_kst, {'usd_krw': float(usd_krw), 'excel_principals': excel_principals, 'filename': st.session_state['uploaded_filename']})
+                except Exception as e: st.warning(f"스냅샷 저장 실패: {e}")
         except Exception as e:
             st.error(f"오류: {e}"); st.stop()
 
     portfolio_dict = st.session_state['portfolio_data']
     usd_krw = st.session_state['usd_krw']
+    if st.session_state['rollup'] is None:
+        st.session_state['rollup'] = refresh_rollup(None, pd.concat(portfolio_dict.values(), ignore_index=True))
+    rollup = st.session_state['rollup']
+    buy_totals = rollup.account_totals('매수금액')
 
     # ==========================================
     # 사이드바: 수익률 비교 기준 설정
     # ==========================================
     with st.sidebar:
+        if st.session_state['price_ts']:
+            st.caption(f"💾 시세 기준 시각: {pd.Timestamp(st.session_state['price_ts']):%Y-%m-%d %H:%M}")
         st.header("📈 수익률 비교 기준")
         compare_mode = st.radio("기준 선택", ["💰 납입원금 기준", "📊 매입원가 기준", "📅 특정기준일 기준"], index=0)
         
@@ -515,7 +701,7 @@ if st.session_state['raw_excel_data'] is not None:
             
         updated_principals = {}
         for sheet_name, df in portfolio_dict.items():
-            default_val = df['매수금액'].sum()
+            default_val = buy_totals.get(sheet_name, 0.0)
             current_val = st.session_state['user_principals'].get(sheet_name, default_val)
             val = st.number_input(f"{sheet_name}", min_value=0.0, value=float(current_val), step=10000.0, format="%.0f", key=f"input_{sheet_name}")
             updated_principals[sheet_name] = val
@@ -557,35 +743,34 @@ if st.session_state['raw_excel_data'] is not None:
         elif compare_mode == "📊 매입원가 기준":
             new_df[price_col_name] = new_df['매수단가']
             new_df['비교금액'] = new_df['매수금액']
-            account_base_vals[sheet] = new_df['매수금액'].sum()
+            account_base_vals[sheet] = buy_totals.get(sheet, 0.0)
             
         else: # "💰 납입원금 기준"
             new_df[price_col_name] = new_df['매수단가']
             new_df['비교금액'] = new_df['매수금액']
-            account_base_vals[sheet] = st.session_state['user_principals'].get(sheet, new_df['매수금액'].sum())
+            account_base_vals[sheet] = st.session_state['user_principals'].get(sheet, buy_totals.get(sheet, 0.0))
             
         display_dict[sheet] = new_df
 
     # --- 퇴직연금/IRP/DC 제외 로직 ---
-    HIDDEN_KEYWORDS = ['퇴직연금', 'IRP', 'DC']
     dashboard_dfs = []
     dashboard_total_base = 0
     
     for name, df in display_dict.items():
-        if not any(k in name for k in HIDDEN_KEYWORDS):
+        if name in rollup.dashboard_accounts:
             dashboard_dfs.append(df)
             dashboard_total_base += account_base_vals[name]
 
     all_df_dashboard = pd.concat(dashboard_dfs, ignore_index=True) if dashboard_dfs else pd.DataFrame() 
     all_df_raw = pd.concat(portfolio_dict.values(), ignore_index=True)
 
-    tab1, tab2, tab3, tab4 = st.tabs(["📊 통합 대시보드", "📂 계좌별 상세", "🎛️ 시뮬레이션", "📝 원본 데이터"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 통합 대시보드", "📂 계좌별 상세", "🎛️ 시뮬레이션", "🛡️ 리스크 분석", "📝 원본 데이터"])
 
     # --- [TAB 1] 통합 대시보드 ---
     with tab1:
         st.subheader("🌐 전체 자산 현황 (퇴직연금 제외)")
         if not all_df_dashboard.empty:
-            total_eval = all_df_dashboard['평가금액'].sum()
+            total_eval = rollup.total('평가금액', rollup.dashboard_accounts)
             total_base = dashboard_total_base
             profit = total_eval - total_base
             yield_rate = (profit / total_base * 100) if total_base > 0 else 0
@@ -601,27 +786,48 @@ if st.session_state['raw_excel_data'] is not None:
             st.divider()
             
             r1_c1, r1_c2 = st.columns(2)
-            with r1_c1: st.plotly_chart(create_pie(all_df_dashboard, '종목명', "1. 종목별 비중"), use_container_width=True, key='t1_c1')
-            with r1_c2: st.plotly_chart(create_pie(all_df_dashboard, '업종', "2. 업종(섹터)별 비중"), use_container_width=True, key='t1_c2')
+            with r1_c1: st.plotly_chart(create_pie(rollup.by('종목명', rollup.dashboard_accounts), '종목명', "1. 종목별 비중"), use_container_width=True, key='t1_c1')
+            with r1_c2: st.plotly_chart(create_pie(rollup.by('업종', rollup.dashboard_accounts), '업종', "2. 업종(섹터)별 비중"), use_container_width=True, key='t1_c2')
             r2_c1, r2_c2 = st.columns(2)
-            with r2_c1: st.plotly_chart(create_pie(all_df_dashboard, '국가', "3. 국가별 비중"), use_container_width=True, key='t1_c3')
-            with r2_c2: st.plotly_chart(create_pie(all_df_dashboard, '유형', "4. 자산 유형별 비중"), use_container_width=True, key='t1_c4')
+            with r2_c1: st.plotly_chart(create_pie(rollup.by('국가', rollup.dashboard_accounts), '국가', "3. 국가별 비중"), use_container_width=True, key='t1_c3')
+            with r2_c2: st.plotly_chart(create_pie(rollup.by('유형', rollup.dashboard_accounts), '유형', "4. 자산 유형별 비중"), use_container_width=True, key='t1_c4')
 
             st.divider()
             st.subheader("📋 전체 자산 상세")
             summary_cols = ['계좌명', '종목명', '업종', '국가', '수량', price_col_name, '현재가', '수익률', '평가금액']
             
             # [포맷팅 개선] 달러/원화 자동 구별
-            disp_dashboard_df = all_df_dashboard[summary_cols + ['통화', '종목코드']].copy()
-            disp_dashboard_df[price_col_name] = disp_dashboard_df.apply(lambda r: format_price_smart(r[price_col_name], r['종목코드'], r['통화']), axis=1)
-            disp_dashboard_df['현재가'] = disp_dashboard_df.apply(lambda r: format_price_smart(r['현재가'], r['종목코드'], r['통화']), axis=1)
-            disp_dashboard_df = disp_dashboard_df.drop(columns=['통화', '종목코드'])
-            
-            fmt_dict = {'수량': '{:,.2f}', '수익률': '{:+.2f}%', '평가금액': '{:,.0f}'}
-            st.dataframe(
-                disp_dashboard_df.style.format(fmt_dict).map(color_profit, subset=['수익률']),
-                use_container_width=True, hide_index=True
-            )
+            render_holdings_table(all_df_dashboard, summary_cols, [price_col_name, '현재가'], key='t1_table')
+
+            # [추가] 이 세션의 직전 업로드 스냅샷 대비 변화 (수량 / 가격 / 손익 요인)
+            prev_snap = st.session_state['prev_snapshot']
+            if prev_snap and snapshot_exists(prev_snap):
+                with st.expander("🔁 지난 업로드 대비 변화"):
+                    prev_data, prev_meta = load_snapshot_cached(prev_snap)
+                    prev_df = pd.concat(prev_data.values(), ignore_index=True)
+                    snap_diff = diff_snapshots(prev_df[~prev_df['계좌명'].map(is_hidden_account)], all_df_dashboard)
+                    snap_diff = snap_diff[(snap_diff['상태'] != '유지') | (snap_diff['평가금액 변화'].round(0) != 0)]
+                    st.caption(f"비교 대상: {prev_meta.get('filename') or '이전 업로드'} (시세 기준 {pd.Timestamp(prev_meta['price_ts']):%Y-%m-%d %H:%M})")
+                    d1, d2, d3 = st.columns(3)
+                    d1.metric("평가금액 변화", f"{snap_diff['평가금액 변화'].sum():+,.0f} 원")
+                    d2.metric("가격 효과", f"{snap_diff['가격효과'].sum():+,.0f} 원")
+                    d3.metric("수량 효과", f"{snap_diff['수량효과'].sum():+,.0f} 원")
+                    money = st.column_config.NumberColumn(format='%+,.0f')
+                    st.dataframe(
+                        snap_diff,
+                        column_config={
+                            '수량_이전': st.column_config.NumberColumn('이전 수량', format='%,.2f'),
+                            '수량_현재': st.column_config.NumberColumn('현재 수량', format='%,.2f'),
+                            '수량변화': st.column_config.NumberColumn('수량 변화', format='%+,.2f'),
+                            '현재가_이전': st.column_config.NumberColumn('이전 가격', format='%,.2f'),
+                            '현재가_현재': st.column_config.NumberColumn('현재 가격', format='%,.2f'),
+                            '가격변동(%)': st.column_config.NumberColumn('가격 변동', format='%+.2f%%'),
+                            '평가금액_이전': st.column_config.NumberColumn('이전 평가금액', format='%,.0f'),
+                            '평가금액_현재': st.column_config.NumberColumn('현재 평가금액', format='%,.0f'),
+                            '가격효과': money, '수량효과': money, '평가금액 변화': money,
+                        },
+                        use_container_width=True, hide_index=True
+                    )
         else:
             st.info("통합 대시보드에 표시할 계좌가 없습니다.")
 
@@ -632,7 +838,7 @@ if st.session_state['raw_excel_data'] is not None:
         target_df = display_dict[selected_sheet]
         
         sheet_base = account_base_vals[selected_sheet]
-        t_eval = target_df['평가금액'].sum()
+        t_eval = rollup.total('평가금액', [selected_sheet])
         t_profit = t_eval - sheet_base
         t_yield = (t_profit / sheet_base * 100) if sheet_base > 0 else 0
         
@@ -647,22 +853,47 @@ if st.session_state['raw_excel_data'] is not None:
         st.divider()
         
         c1, c2, c3 = st.columns(3)
-        with c1: st.plotly_chart(create_pie(target_df, '종목명', "1. 종목 비중"), use_container_width=True, key='t2_c1')
-        with c2: st.plotly_chart(create_pie(target_df, '업종', "2. 업종(섹터) 비중"), use_container_width=True, key='t2_c2_new')
-        with c3: st.plotly_chart(create_pie(target_df, '유형', "3. 유형 비중"), use_container_width=True, key='t2_c3')
+        with c1: st.plotly_chart(create_pie(rollup.by('종목명', [selected_sheet]), '종목명', "1. 종목 비중"), use_container_width=True, key='t2_c1')
+        with c2: st.plotly_chart(create_pie(rollup.by('업종', [selected_sheet]), '업종', "2. 업종(섹터) 비중"), use_container_width=True, key='t2_c2_new')
+        with c3: st.plotly_chart(create_pie(rollup.by('유형', [selected_sheet]), '유형', "3. 유형 비중"), use_container_width=True, key='t2_c3')
         
         st.caption(f"📋 {selected_sheet} 보유 종목")
         
-        disp_target_df = target_df[['종목명', '업종', '수량', price_col_name, '현재가', '수익률', '평가금액', '통화', '종목코드']].copy()
-        disp_target_df[price_col_name] = disp_target_df.apply(lambda r: format_price_smart(r[price_col_name], r['종목코드'], r['통화']), axis=1)
-        disp_target_df['현재가'] = disp_target_df.apply(lambda r: format_price_smart(r['현재가'], r['종목코드'], r['통화']), axis=1)
-        disp_target_df = disp_target_df.drop(columns=['통화', '종목코드'])
-
-        fmt_dict_tab2 = {'수량': '{:,.2f}', '수익률': '{:+.2f}%', '평가금액': '{:,.0f}'}
-        st.dataframe(
-            disp_target_df.style.format(fmt_dict_tab2).map(color_profit, subset=['수익률']),
-            use_container_width=True, hide_index=True
-        )
+        target_cols = ['종목명', '업종', '수량', price_col_name, '현재가', '수익률', '평가금액']
+        render_holdings_table(target_df, target_cols, [price_col_name, '현재가'], key=f"t2_table_{selected_sheet}")
+
+        # [추가] 기간 수익률 · 낙폭 (로컬 히스토리 저장소 기반, 재다운로드 없음 · 통합문서 해시별로 분리)
+        with st.expander("📈 기간 수익률 · 낙폭 추이"):
+            hist_df = load_history(st.session_state['workbook_hash'], selected_sheet)
+            if not has_backfill(st.session_state['workbook_hash'], selected_sheet):
+                st.caption("현재 보유수량 기준으로 과거 1년 평가금액을 한 번만 역산해 저장합니다. 이후에는 거래일마다 1행씩 자동 추가됩니다. (히스토리는 통합문서별로 저장되며, 이 화면에서 수정본을 다시 올리면 이어서 기록됩니다)")
+                if st.button("과거 1년 히스토리 생성", key=f"backfill_{selected_sheet}"):
+                    holdings = portfolio_dict[selected_sheet]
+                    end_d = now_kst.date() - timedelta(days=1)
+                    start_d = end_d - timedelta(days=365)
+                    with st.spinner("과거 시세 일괄 조회 중..."):
+                        try:
+                            matrix = get_hist_price_matrix(holdings_ticker_pairs(holdings), start_d, end_d)
+                            fx_series = get_hist_fx_series(start_d - timedelta(days=7), end_d)
+                            backfilled = backfill_history(st.session_state['workbook_hash'], selected_sheet, holdings, matrix, fx_series)
+                        except Exception as e:
+                            backfilled = False
+                            st.warning(f"히스토리 생성 실패: {e}")
+                    if backfilled: st.rerun()
+                    else: st.warning("과거 시세 또는 환율을 받지 못해 히스토리를 만들지 못했습니다. 잠시 후 다시 시도해 주세요.")
+
+            if hist_df.empty:
+                st.info("저장된 히스토리가 없습니다.")
+            else:
+                nav = hist_df.sum(axis=1)
+                rets = period_returns(nav)
+                ret_cols = st.columns(len(rets)) if rets else []
+                for col, (label, val) in zip(ret_cols, rets.items()):
+                    col.metric(label, f"{val:+.2f} %")
+                st.caption("평가금액 기준 수익률입니다. (입출금 효과 미반영)" if rets else "기간 수익률은 2거래일 이상 기록된 뒤부터 표시됩니다.")
+                h1, h2 = st.columns(2)
+                with h1: st.plotly_chart(px.line(nav.rename('평가금액'), title="평가금액 추이").update_layout(showlegend=False), use_container_width=True, key='t2_hist_nav')
+                with h2: st.plotly_chart(px.area(drawdown(nav).rename('낙폭(%)'), title="낙폭 (Drawdown, %)").update_layout(showlegend=False), use_container_width=True, key='t2_hist_dd')
 
     # --- [TAB 3] 시뮬레이션 ---
     with tab3:
@@ -676,7 +907,7 @@ if st.session_state['raw_excel_data'] is not None:
             st.session_state['sim_df'] = portfolio_dict[sel_sim_sheet].copy()
             
         sim_df = st.session_state['sim_df']
-        cur_total = portfolio_dict[sel_sim_sheet]['평가금액'].sum()
+        cur_total = rollup.total('평가금액', [sel_sim_sheet])
 
         with st.expander("➕ 종목 추가하기 (검색 및 자동완성)"):
             krx_map = get_korean_market_map()
@@ -726,7 +957,7 @@ if st.session_state['raw_excel_data'] is not None:
             st.button("리스트에 추가", key="add_list_btn", on_click=add_sim_item_callback)
 
         sim_disp = sim_df[['종목명', '종목코드', '통화', '현재가', '시뮬레이션 수량']].copy()
-        sim_disp['현재가(표시)'] = sim_disp.apply(lambda x: format_price_smart(x['현재가'], x['종목코드'], x['통화']), axis=1)
+        sim_disp['현재가(표시)'] = format_price_column(sim_disp['현재가'], sim_disp['종목코드'], sim_disp['통화'])
 
         edited = st.data_editor(
             sim_disp[['종목명', '종목코드', '현재가(표시)', '시뮬레이션 수량']],
@@ -773,7 +1004,7 @@ if st.session_state['raw_excel_data'] is not None:
         
         if not plan_df.empty:
             plan_df['구분'] = plan_df['수량변동'].apply(lambda x: '매수 (BUY)' if x > 0 else '매도 (SELL)')
-            plan_df['현재가_표시'] = plan_df.apply(lambda x: format_price_smart(x['현재가'], x['종목코드'], x['통화']), axis=1)
+            plan_df['현재가_표시'] = format_price_column(plan_df['현재가'], plan_df['종목코드'], plan_df['통화'])
             
             plan_display = plan_df[['종목명', '종목코드', '현재가_표시', '구분', '수량', '시뮬레이션 수량', '수량변동', '매매금액']].copy()
             plan_display.columns = ['종목명', '코드', '현재가', '구분', '현재수량', '목표수량', '변동수량', '예상 소요금액']
@@ -799,6 +1030,66 @@ if st.session_state['raw_excel_data'] is not None:
         with c2: st.plotly_chart(create_pie(valid_sim, '업종', "2. 업종 비중"), use_container_width=True, key='t3_c2')
         with c3: st.plotly_chart(create_pie(valid_sim, '유형', "3. 유형 비중"), use_container_width=True, key='t3_c3')
 
-    # --- [TAB 4] 원본 데이터 ---
+    # --- [TAB 4] 리스크 분석 ---
     with tab4:
+        st.subheader("🛡️ 포트폴리오 리스크 (퇴직연금 제외, 최근 1년 · 원화 환산)")
+        if all_df_dashboard.empty:
+            st.info("분석할 계좌가 없습니다.")
+        elif st.toggle("리스크 분석 실행", key="risk_toggle", help="최근 1년 과거 시세를 일괄 조회합니다. 결과는 보유 구성과 날짜별로 캐시됩니다."):
+            with st.spinner("과거 시세 행렬 조회 및 리스크 계산 중..."):
+                risk = get_portfolio_risk(holdings_hash(all_df_dashboard), now_kst.date(), all_df_dashboard)
+            if risk is None:
+                st.warning("리스크를 계산할 과거 시세가 부족합니다.")
+            else:
+                period_start, period_end = risk['기간']
+                st.caption(f"분석 기간: {period_start:%Y-%m-%d} ~ {period_end:%Y-%m-%d}")
+                unpriced = risk['시세 없음']
+                if not unpriced.empty:
+                    st.warning(f"과거 시세를 받지 못한 {len(unpriced)}개 종목(평가금액 {unpriced['평가금액'].sum():,.0f}원)은 비중에서 제외하고 계산했습니다: {', '.join(unpriced['종목코드'])}")
+                var_keys = [k for k in risk if k.startswith('VaR')]
+                r_cols = st.columns(2 + len(risk['베타']))
+                r_cols[0].metric("연 변동성", f"{risk['연변동성(%)']:.2f} %")
+                r_cols[1].metric(var_keys[0], f"{risk[var_keys[0]]:.2f} %", f"-{risk[var_keys[1]]:,.0f} 원", delta_color="off")
+                for col, (b_name, beta) in zip(r_cols[2:], risk['베타'].items()):
+                    col.metric(f"베타 ({b_name})", f"{beta:.2f}")
+
+                name_map = all_df_dashboard.assign(_k=all_df_dashboard['종목코드'].astype(str).str.strip().str.upper()).groupby('_k')['종목명'].first()
+                per_holding = risk['종목별'].copy()
+                per_holding.insert(1, '종목명', per_holding['종목코드'].map(name_map))
+                st.dataframe(
+                    per_holding,
+                    column_config={
+                        '비중(%)': st.column_config.NumberColumn('비중(%)', format='%.2f'),
+                        '평가금액': st.column_config.NumberColumn('평가금액', format='%,.0f'),
+                        '연변동성(%)': st.column_config.NumberColumn('연변동성(%)', format='%.2f'),
+                        '위험기여도(%)': st.column_config.NumberColumn('위험기여도(%)', format='%.2f'),
+                    },
+                    use_container_width=True, hide_index=True
+                )
+
+                top = per_holding['종목코드'].head(30).tolist()
+                corr = risk['상관계수'].loc[top, top]
+                corr.index = corr.columns = [name_map.get(t, t) for t in top]
+                st.plotly_chart(px.imshow(corr, zmin=-1, zmax=1, color_continuous_scale='RdBu_r', title="상관계수 (비중 상위 30종목)"), use_container_width=True, key='t4_corr')
+
+    # --- [TAB 5] 원본 데이터 ---
+    with tab5:
         st.dataframe(all_df_raw)
+
+        # [추가] 평가 결과 내보내기 (버튼을 누를 때만 파일 생성)
+        st.markdown("##### 📤 데이터 내보내기")
+        export_cols = ['계좌명', '종목코드', '종목명', '업종', '국가', '유형', '통화', '수량', '매수단가', '현재가', '매수금액', '평가금액', '수익률']
+        export_frames = {'보유종목': all_df_raw[[c for c in export_cols if c in all_df_raw.columns]], '계좌별_합계': rollup.table()}
+        for dim in ROLLUP_DIMS: export_frames[f'배분_{dim}'] = rollup.table(dim)
+        export_frames['매매계획표'] = plan_df[['계좌명', '종목명', '종목코드', '통화', '현재가', '수량', '시뮬레이션 수량', '수량변동', '매매금액']].rename(
+            columns={'수량': '현재수량', '시뮬레이션 수량': '목표수량', '수량변동': '변동수량', '매매금액': '예상 소요금액'})
+        st.caption(f"보유종목 · 계좌/종목/업종/국가/유형/통화별 합계 · 매매 계획표({sel_sim_sheet})를 한 파일로 내보냅니다.")
+
+        ex_cols = st.columns(len(EXPORT_FORMATS))
+        for col, fmt in zip(ex_cols, EXPORT_FORMATS):
+            ext, mime = export_file_info(export_frames, fmt)
+            col.download_button(
+                f"{fmt.upper()} 내보내기", data=partial(build_export, export_frames, fmt),
+                file_name=f"portfolio_export_{now_kst.strftime('%Y%m%d_%H%M')}{ext}", mime=mime,
+                on_click='ignore', use_container_width=True, key=f"export_{fmt}"
+            )
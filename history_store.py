@@ -0,0 +1,181 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# 계좌별 일별 평가금액 히스토리 저장소 (Parquet, append-only)
+#  - 통합문서(내용 해시) / 계좌 폴더 하나에 파트 파일을 계속 추가하는 구조
+#    (시트 이름만으로 나누면 같은 양식을 쓰는 다른 사용자·통합문서와 섞임)
+#    · 백필: YYYYMMDD-YYYYMMDD.parquet (1회, 과거 가격 행렬로 역산)
+#    · 일별: YYYYMMDD.parquet (거래일당 1행, 당일 재계산 시 당일 파일만 갱신)
+#    · 백필 완료 표시: BACKFILL_MARKER 파일 (압축 파일명과 구분하기 위해 별도 기록)
+#  - 같은 세션에서 수정한 통합문서를 다시 올리면 이전 해시의 계좌 폴더를 새 해시로 이어받고,
+#    이어받아진(SUPERSEDED_MARKER) 폴더는 유예 기간 동안 쓰이지 않으면 삭제
+#  - 행 = 날짜, 열 = 종목코드, 값 = 평가금액(원)
+# -----------------------------------------------------------------------------
+DATA_DIR = Path(os.environ.get('PORTFOLIO_DATA_DIR', '.portfolio_data'))
+HISTORY_DIR = DATA_DIR / 'history'
+COMPACT_THRESHOLD = 64
+BACKFILL_MARKER = '.backfilled'
+SUPERSEDED_MARKER = '.superseded'
+SUPERSEDED_GRACE_DAYS = 7
+
+def _safe_name(name, default):
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', str(name)).strip('_') or default
+
+def _account_dir(workbook, account):
+    return _workbook_dir(workbook) / _safe_name(account, 'account')
+
+def _workbook_dir(workbook):
+    return HISTORY_DIR / _safe_name(workbook, 'workbook')
+
+def _part_files(workbook, account):
+    d = _account_dir(workbook, account)
+    return sorted(d.glob('*.parquet')) if d.exists() else []
+
+def _part_range(path):
+    # 파일명에서 (시작일, 종료일) 추출 → 본문을 읽지 않고 마지막 기록일 확인
+    stem = path.stem.split('-')
+    return pd.Timestamp(stem[0]), pd.Timestamp(stem[-1])
+
+def atomic_write(path, write):
+    # 같은 폴더의 고유 임시파일에 쓴 뒤 교체 → 세션끼리 동시에 써도 반쯤 쓴 파일이 보이지 않음
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=f".{path.stem}.", suffix='.tmp', delete=False) as f:
+        tmp = Path(f.name)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+def _write_part(workbook, account, frame, name):
+    d = _account_dir(workbook, account)
+    d.mkdir(parents=True, exist_ok=True)
+    frame = frame.copy()
+    frame.index = pd.DatetimeIndex(frame.index, name='날짜')
+    frame.columns = [str(c) for c in frame.columns]
+    atomic_write(d / f"{name}.parquet", frame.astype(float).to_parquet)
+
+def has_backfill(workbook, account):
+    return (_account_dir(workbook, account) / BACKFILL_MARKER).exists()
+
+def last_recorded_date(workbook, account):
+    parts = _part_files(workbook, account)
+    return max(_part_range(p)[1] for p in parts) if parts else None
+
+def load_history(workbook, account):
+    parts = _part_files(workbook, account)
+    if not parts: return pd.DataFrame()
+    hist = pd.concat([pd.read_parquet(p) for p in parts])
+    hist = hist[~hist.index.duplicated(keep='last')].sort_index()
+    return hist.fillna(0.0)
+
+def compact_history(workbook, account):
+    # 파트 파일이 너무 많아지면 하나로 합쳐 읽기 비용을 줄임 (내용은 동일)
+    parts = _part_files(workbook, account)
+    if len(parts) < 2: return
+    hist = load_history(workbook, account)
+    name = f"{hist.index[0]:%Y%m%d}-{hist.index[-1]:%Y%m%d}"
+    _write_part(workbook, account, hist, name)
+    keep = _account_dir(workbook, account) / f"{name}.parquet"
+    for p in parts:
+        if p != keep: p.unlink()
+
+def carry_history(old_workbook, new_workbook):
+    # 이전 통합문서의 계좌별 히스토리를 새 통합문서로 복사 (새 쪽에 이미 있는 계좌는 유지)
+    old_dir, new_dir = _workbook_dir(old_workbook), _workbook_dir(new_workbook)
+    if old_dir == new_dir or not old_dir.exists(): return
+    new_dir.mkdir(parents=True, exist_ok=True)
+    for src in old_dir.iterdir():
+        dst = new_dir / src.name
+        if not src.is_dir() or dst.exists(): continue
+        # 임시 폴더에 복사한 뒤 이름 변경 → 다른 세션과 동시에 이어받아도 한쪽만 반영
+        tmp = Path(tempfile.mkdtemp(dir=new_dir, prefix=f".{src.name}."))
+        shutil.copytree(src, tmp, dirs_exist_ok=True)
+        try: os.rename(tmp, dst)
+        except OSError: shutil.rmtree(tmp, ignore_errors=True)
+    (old_dir / SUPERSEDED_MARKER).touch()
+    prune_history()
+
+def prune_history():
+    # 이어받아진 뒤 유예 기간 동안 새 기록이 없는 통합문서 폴더 삭제
+    if not HISTORY_DIR.exists(): return
+    cutoff = time.time() - SUPERSEDED_GRACE_DAYS * 86400
+    for d in HISTORY_DIR.iterdir():
+        if not (d / SUPERSEDED_MARKER).exists(): continue
+        if max((p.stat().st_mtime for p in d.rglob('*')), default=0) < cutoff: shutil.rmtree(d, ignore_errors=True)
+
+def holdings_values(holdings):
+    # 종목코드별 평가금액(원) 합계 (같은 종목이 여러 행이면 합산)
+    keys = holdings['종목코드'].astype(str).str.strip().str.upper()
+    return holdings['평가금액'].astype(float).groupby(keys).sum()
+
+def to_krw_prices(holdings, price_matrix, fx):
+    # 현지통화 종가 행렬 → 원화 환산 단가 행렬 (현금: KRW=1, USD=환율)
+    # 과거 시세가 전혀 없는 종목은 NaN 열로 남김 (0 으로 채우면 현금처럼 보임)
+    keys = holdings['종목코드'].astype(str).str.strip().str.upper()
+    currencies = holdings['통화'].groupby(keys).first()
+    index = price_matrix.index if not price_matrix.empty else fx.index
+    fx = fx.reindex(index.union(fx.index)).sort_index().ffill().bfill().reindex(index)
+    # 시세 행렬이 비어 있어도(전부 조회 실패 / 현금만 보유) 환율 날짜 축으로 행을 만듦
+    prices = price_matrix.reindex(index=index, columns=currencies.index).astype(float)
+    prices = prices.ffill().bfill()
+    for ticker, curr in currencies.items():
+        if ticker == 'KRW': prices[ticker] = 1.0
+        elif ticker == 'USD': prices[ticker] = fx.values
+        elif curr == 'USD': prices[ticker] = prices[ticker] * fx.values
+    return prices
+
+def backfill_history(workbook, account, holdings, price_matrix, fx):
+    # 현재 보유수량 기준으로 과거 평가금액을 역산해 1회 저장 (이미 백필했으면 건너뜀)
+    # 달러 자산이 있는데 과거 환율이 없으면 저장하지 않음 (0 원으로 빠진 평가금액이 기록되는 것 방지)
+    if has_backfill(workbook, account): return False
+    has_usd = (holdings['통화'].astype(str) == 'USD').any() or holdings['종목코드'].astype(str).str.strip().str.upper().eq('USD').any()
+    if has_usd and fx.dropna().empty: return False
+    krw_prices = to_krw_prices(holdings, price_matrix, fx)
+    first = min((_part_range(p)[0] for p in _part_files(workbook, account)), default=None)
+    if first is not None: krw_prices = krw_prices[krw_prices.index < first]
+    krw_prices = krw_prices[krw_prices.index.dayofweek < 5]
+    if krw_prices.empty: return False
+    keys = holdings['종목코드'].astype(str).str.strip().str.upper()
+    qty = holdings['수량'].astype(float).groupby(keys).sum()
+    values = krw_prices * qty.reindex(krw_prices.columns).values
+    _write_part(workbook, account, values, f"{values.index[0]:%Y%m%d}-{values.index[-1]:%Y%m%d}")
+    (_account_dir(workbook, account) / BACKFILL_MARKER).touch()
+    return True
+
+def append_history(workbook, account, holdings, as_of):
+    # 거래일(평일)마다 1행 추가. 과거 날짜는 무시하고, 당일은 최신 평가금액으로 덮어씀
+    as_of = pd.Timestamp(as_of).normalize()
+    if as_of.dayofweek >= 5: return False
+    last = last_recorded_date(workbook, account)
+    if last is not None and as_of < last: return False
+    row = holdings_values(holdings).to_frame(as_of).T
+    _write_part(workbook, account, row, f"{as_of:%Y%m%d}")
+    if len(_part_files(workbook, account)) > COMPACT_THRESHOLD: compact_history(workbook, account)
+    return True
+
+def period_returns(nav):
+    # 1W / 1M / YTD / 설정 이후 수익률(%) — 기준일 이전 마지막 기록값 대비
+    nav = nav[nav > 0]
+    if len(nav) < 2: return {}
+    last_date, last_val = nav.index[-1], nav.iloc[-1]
+    starts = {
+        '1W': last_date - pd.Timedelta(days=7),
+        '1M': last_date - pd.DateOffset(months=1),
+        'YTD': pd.Timestamp(last_date.year, 1, 1) - pd.Timedelta(days=1),
+        '설정 이후': nav.index[0],
+    }
+    result = {}
+    for label, start in starts.items():
+        base = nav.asof(start) if start >= nav.index[0] else nav.iloc[0]
+        result[label] = (last_val / base - 1) * 100 if base > 0 else 0.0
+    return result
+
+def drawdown(nav):
+    nav = nav[nav > 0]
+    return (nav / nav.cummax() - 1) * 100
@@ -0,0 +1,247 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# 다중 세션 부하 테스트: python loadtest.py --sessions 1 2 4 8
+#  - 실제 app.py 를 Streamlit AppTest 로 헤드리스 실행 (세션 N개 동시)
+#  - 시세 제공자(yfinance / FinanceDataReader / 네이버 HTTP)는 오프라인 가짜로 대체
+#  - 세션 시나리오: 엑셀 업로드 → 비교 기준 전환 → 기준일 선택 → 시뮬레이션 수량 편집
+#  - 동시성 단계별로 상호작용 지연 백분위 / 제공자 호출 수 / 프로세스 RSS 출력
+# -----------------------------------------------------------------------------
+APP_PATH = Path(__file__).resolve().parent / 'app.py'
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+COMPARE_MODES = ["📊 매입원가 기준", "📅 특정기준일 기준", "💰 납입원금 기준"]
+
+PROVIDER_CALLS = Counter()
+_calls_lock = threading.Lock()
+PROVIDER_LATENCY = 0.0
+
+def _count(name):
+    with _calls_lock: PROVIDER_CALLS[name] += 1
+    if PROVIDER_LATENCY: time.sleep(PROVIDER_LATENCY)
+
+# -----------------------------------------------------------------------------
+# 오프라인 가짜 시세 제공자 (종목코드로 시드를 고정해 매번 같은 시계열 반환)
+# -----------------------------------------------------------------------------
+def _fake_close(symbol, start=None, end=None, periods=None):
+    end = pd.Timestamp(end) if end is not None else pd.Timestamp.today().normalize()
+    idx = pd.bdate_range(start=start, end=end) if start is not None else pd.bdate_range(end=end, periods=periods or 250)
+    rng = np.random.default_rng(sum(map(ord, str(symbol))))
+    base = 1400.0 if '/' in str(symbol) else (70000.0 if str(symbol)[:1].isdigit() else 150.0)
+    return pd.DataFrame({'Close': base * np.exp(np.cumsum(rng.normal(0, 0.01, len(idx))))}, index=idx)
+
+class FakeTicker:
+    def __init__(self, ticker):
+        self.ticker = ticker
+        self.info = {'shortName': ticker, 'sector': 'IT', 'quoteType': 'EQUITY'}
+
+    def history(self, period=None, start=None, end=None):
+        _count('yfinance.history')
+        return _fake_close(self.ticker, start, end, periods=1 if period else None)
+
+def fake_download(symbols, start=None, end=None, **kwargs):
+    _count('yfinance.download')
+    symbols = [symbols] if isinstance(symbols, str) else list(symbols)
+    close = pd.DataFrame({s: _fake_close(s, start, end)['Close'] for s in symbols})
+    close.columns = pd.MultiIndex.from_product([['Close'], close.columns])
+    return close
+
+def fake_data_reader(symbol, start=None, end=None):
+    _count('fdr.DataReader')
+    return _fake_close(symbol, start, end)
+
+def fake_stock_listing(market):
+    _count('fdr.StockListing')
+    codes = [f"{i:06d}" for i in range(5930, 5930 + 200)]
+    return pd.DataFrame({'Code': codes, 'Name': [f"국내종목{c}" for c in codes], 'Sector': '반도체'})
+
+class FakeResponse:
+    def __init__(self, url):
+        code = url.rsplit('=', 1)[-1]
+        self.text = f'<div class="wrap_company"><h2><a href="#">국내종목{code}</a></h2><dd>현재가 70,000</dd><dt><span class="blind">업종</span></dt> <dd>반도체</dd>'
+
+    def raise_for_status(self): pass
+
+    def json(self): return {'items': [[]]}
+
+def fake_requests_get(url, *args, **kwargs):
+    _count('naver.http')
+    return FakeResponse(url)
+
+def install_fake_providers():
+    # app.py 가 import 하기 전에 sys.modules 에 가짜 모듈을 등록
+    import requests
+    yf = types.ModuleType('yfinance')
+    yf.Ticker, yf.download = FakeTicker, fake_download
+    fdr = types.ModuleType('FinanceDataReader')
+    fdr.DataReader, fdr.StockListing = fake_data_reader, fake_stock_listing
+    autorefresh = types.ModuleType('streamlit_autorefresh')
+    autorefresh.st_autorefresh = lambda **kwargs: 0
+    sys.modules.update({'yfinance': yf, 'FinanceDataReader': fdr, 'streamlit_autorefresh': autorefresh})
+    requests.get = fake_requests_get
+
+def make_apptest_concurrent():
+    # AppTest 는 단일 세션용이라 동시 실행 시 전역 상태가 충돌함 → 실제 서버처럼 프로세스 공용으로 맞춤
+    #  1) 실행마다 app.py 를 새로 컴파일 (Python 3.11 의 ast.parse 는 동시 호출에 안전하지 않음)
+    #     → 바이트코드를 프로세스당 한 번만 컴파일해 공유
+    #  2) 실행이 끝날 때마다 전역 Runtime._instance 를 None 으로 되돌려 다른 세션 실행이 실패함
+    #     → 마지막으로 설정된 런타임을 계속 돌려줌
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    original_get_bytecode = ScriptCache.get_bytecode
+    bytecode, lock = {}, threading.Lock()
+
+    def get_bytecode(self, script_path):
+        with lock:
+            if script_path not in bytecode: bytecode[script_path] = original_get_bytecode(self, script_path)
+            return bytecode[script_path]
+
+    last_runtime = []
+
+    def instance(cls):
+        rt = cls._instance
+        if rt is not None: last_runtime[:] = [rt]
+        elif last_runtime: rt = last_runtime[0]
+        else: raise RuntimeError("Runtime hasn't been created!")
+        return rt
+
+    ScriptCache.get_bytecode = get_bytecode
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(last_runtime))
+
+# -----------------------------------------------------------------------------
+# 합성 통합문서 / 세션 시나리오
+# -----------------------------------------------------------------------------
+def make_workbook(seed, n_accounts, n_holdings):
+    rng = np.random.default_rng(seed)
+    out = io.BytesIO()
+    with pd.ExcelWriter(out, engine='openpyxl') as writer:
+        for a in range(n_accounts):
+            kr = [f"{5930 + i:06d}" for i in rng.choice(200, n_holdings // 2, replace=False)]
+            us = [f"US{i:03d}" for i in rng.choice(500, n_holdings - len(kr), replace=False)]
+            codes = kr + us + ['KRW', 'USD']
+            pd.DataFrame({
+                '종목코드': codes,
+                '종목명': ['' if c in kr else c for c in codes[:-2]] + ['원화예수금', '달러예수금'],
+                '업종': '기타',
+                '국가': ['한국'] * len(kr) + ['미국'] * len(us) + ['한국', '미국'],
+                '수량': rng.integers(1, 100, len(codes)),
+                '매수단가': [float(rng.uniform(50000, 90000)) for _ in kr] + [float(rng.uniform(50, 300)) for _ in us] + [1, 1],
+                '납입원금': [1e7] + [None] * (len(codes) - 1),
+            }).to_excel(writer, index=False, sheet_name=f"계좌{a + 1}" if a % 4 != 3 else f"퇴직연금(IRP){a + 1}")
+    return out.getvalue()
+
+def run_session(session_id, workbook, timeout):
+    from streamlit.testing.v1 import AppTest
+    timings = defaultdict(list)
+    errors = []
+
+    def step(name, action):
+        t0 = time.perf_counter()
+        at = action()
+        timings[name].append(time.perf_counter() - t0)
+        if at.exception: errors.append(f"[{session_id}] {name}: {at.exception[0].message}")
+        return at
+
+    at = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+    step('첫 화면', at.run)
+    step('엑셀 업로드', lambda: at.file_uploader[0].set_value((f"portfolio_{session_id}.xlsx", workbook, XLSX_MIME)).run())
+    if errors: return timings, errors
+
+    for mode in COMPARE_MODES[:2]:
+        step('비교 기준 전환', lambda: at.sidebar.radio[0].set_value(mode).run())
+    for days in [1, 7, 30]:
+        step('기준일 선택', lambda: at.sidebar.date_input[0].set_value(date.today() - timedelta(days=days)).run())
+    step('비교 기준 전환', lambda: at.sidebar.radio[0].set_value(COMPARE_MODES[2]).run())
+
+    # data_editor 는 AppTest 로 직접 조작할 수 없어, 편집 결과가 반영되는 sim_df 를 수정 후 재실행
+    for i in range(3):
+        sim_df = at.session_state['sim_df'].copy()
+        sim_df.loc[sim_df.index[i % len(sim_df)], '시뮬레이션 수량'] += 10
+        at.session_state['sim_df'] = sim_df
+        step('시뮬레이션 편집', at.run)
+    return timings, errors
+
+def read_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'): return int(line.split()[1]) / 1024
+    except OSError: pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_level(n_sessions, args):
+    import streamlit as st
+    if not args.warm_cache:
+        st.cache_data.clear()
+        st.cache_resource.clear()
+    PROVIDER_CALLS.clear()
+    # 단계마다 새 통합문서를 써서 이전 단계 스냅샷이 재사용되지 않게 함
+    seeds = [n_sessions * 1000 + (0 if args.same_workbook else i) for i in range(n_sessions)]
+    workbooks = [make_workbook(seed, args.accounts, args.holdings) for seed in seeds]
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n_sessions) as pool:
+        results = list(pool.map(lambda i: run_session(i, workbooks[i], args.timeout), range(n_sessions)))
+    wall = time.perf_counter() - t0
+
+    timings, errors = defaultdict(list), []
+    for t, e in results:
+        for name, values in t.items(): timings[name].extend(values)
+        errors.extend(e)
+    return timings, errors, wall, Counter(PROVIDER_CALLS), read_rss_mb()
+
+def print_report(n_sessions, timings, errors, wall, calls, rss):
+    print(f"\n=== 동시 세션 {n_sessions}개 · 소요 {wall:.2f}s · RSS {rss:,.0f} MB ===")
+    print(f"{'상호작용':<12}{'횟수':>6}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for name, values in timings.items():
+        ms = np.array(values) * 1000
+        p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+        print(f"{name:<12}{len(ms):>6}{p50:>10.0f}{p90:>10.0f}{p99:>10.0f}{ms.max():>10.0f}")
+    print("제공자 호출: " + (", ".join(f"{k}={v}" for k, v in sorted(calls.items())) or "없음"))
+    for e in errors[:5]: print(f"오류 {e}")
+    if len(errors) > 5: print(f"... 외 {len(errors) - 5}건")
+
+def main():
+    global PROVIDER_LATENCY
+    parser = argparse.ArgumentParser(description="app.py 다중 세션 부하 테스트 (오프라인 가짜 시세 제공자)")
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8], help="동시 세션 수 단계")
+    parser.add_argument('--accounts', type=int, default=3, help="통합문서당 계좌(시트) 수")
+    parser.add_argument('--holdings', type=int, default=20, help="계좌당 보유 종목 수 (현금 제외)")
+    parser.add_argument('--provider-latency', type=float, default=0.0, help="가짜 제공자 호출당 지연(초)")
+    parser.add_argument('--same-workbook', action='store_true', help="모든 세션이 같은 통합문서를 업로드")
+    parser.add_argument('--warm-cache', action='store_true', help="단계 사이에 st.cache_data 를 비우지 않음")
+    parser.add_argument('--timeout', type=float, default=300, help="상호작용당 제한 시간(초)")
+    args = parser.parse_args()
+    PROVIDER_LATENCY = args.provider_latency
+
+    # 히스토리 / 스냅샷은 임시 폴더에 기록 (history_store 가 import 될 때 경로를 읽음)
+    os.environ.setdefault('PORTFOLIO_DATA_DIR', tempfile.mkdtemp(prefix='portfolio_loadtest_'))
+    install_fake_providers()
+    make_apptest_concurrent()
+    # 설정 파일을 먼저 읽어 둬야 이후 로그 레벨이 기본값(info)으로 되돌아가지 않음
+    from streamlit import config as st_config
+    from streamlit.logger import set_log_level
+    st_config.get_config_options()
+    set_log_level('error')
+    sys.path.insert(0, str(APP_PATH.parent))
+    print(f"데이터 폴더: {os.environ['PORTFOLIO_DATA_DIR']}")
+
+    for n in args.sessions:
+        print_report(n, *run_level(n, args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+import io
+import zipfile
+import openpyxl
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# -----------------------------------------------------------------------------
+# 평가 결과 내보내기 (xlsx / CSV / Parquet)
+#  - 여러 표(보유종목, 배분 롤업, 매매 계획표)를 한 파일로 묶음
+#  - 행을 CHUNK_ROWS 단위로 나눠 쓰므로 큰 표도 메모리 사용이 일정
+#    · xlsx: openpyxl write-only 모드 (시트 1개 = 표 1개)
+#    · CSV / Parquet: 표가 여러 개면 zip 으로 묶음 (CSV 는 엑셀 호환 UTF-8 BOM)
+# -----------------------------------------------------------------------------
+CHUNK_ROWS = 50_000
+EXPORT_FORMATS = {
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('.csv', 'text/csv'),
+    'parquet': ('.parquet', 'application/octet-stream'),
+}
+
+def export_file_info(frames, fmt):
+    # (확장자, MIME) — 다운로드 버튼을 그릴 때 파일을 만들지 않고도 알 수 있음
+    ext, mime = EXPORT_FORMATS[fmt]
+    if fmt != 'xlsx' and len(frames) > 1: return '.zip', 'application/zip'
+    return ext, mime
+
+def _chunks(df):
+    for start in range(0, len(df), CHUNK_ROWS):
+        yield df.iloc[start:start + CHUNK_ROWS]
+
+def _sheet_title(name):
+    for ch in '[]:*?/\\': name = name.replace(ch, '_')
+    return name[:31]
+
+def _write_xlsx(frames, out):
+    wb = openpyxl.Workbook(write_only=True)
+    for name, df in frames.items():
+        ws = wb.create_sheet(title=_sheet_title(name))
+        ws.append([str(c) for c in df.columns])
+        for chunk in _chunks(df):
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            for row in chunk.itertuples(index=False, name=None): ws.append(row)
+    wb.save(out)
+
+def _write_csv(df, out):
+    text = io.TextIOWrapper(out, encoding='utf-8-sig', newline='')
+    for i, chunk in enumerate(_chunks(df)):
+        chunk.to_csv(text, index=False, header=(i == 0))
+    if df.empty: df.to_csv(text, index=False)
+    text.flush()
+    text.detach()
+
+def _write_parquet(df, out):
+    # 혼합형(숫자/문자) object 열은 문자열로 통일
+    df = df.copy()
+    for c in df.columns[df.dtypes == object]:
+        df[c] = df[c].where(df[c].isna(), df[c].astype(str))
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(out, schema, compression='zstd') as writer:
+        for chunk in _chunks(df):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        if df.empty: writer.write_table(schema.empty_table())
+
+def build_export(frames, fmt):
+    out = io.BytesIO()
+    if fmt == 'xlsx':
+        _write_xlsx(frames, out)
+        return out.getvalue()
+
+    writer = _write_csv if fmt == 'csv' else _write_parquet
+    ext = EXPORT_FORMATS[fmt][0]
+    if len(frames) == 1:
+        writer(next(iter(frames.values())), out)
+        return out.getvalue()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for name, df in frames.items():
+            with zf.open(f"{name}{ext}", 'w') as entry: writer(df, entry)
+    return out.getvalue()
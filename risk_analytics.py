@@ -0,0 +1,81 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from history_store import holdings_values, to_krw_prices
+
+# -----------------------------------------------------------------------------
+# 포트폴리오 리스크 분석 (NumPy 일괄 계산)
+#  - 입력: 날짜 x 종목 종가 행렬(현지통화) + 과거 USD/KRW 환율
+#  - 원화 환산 수익률 행렬 한 번으로 변동성 / 공분산·상관 / 베타 / VaR / 위험기여도 계산
+# -----------------------------------------------------------------------------
+TRADING_DAYS = 252
+CASH_TICKERS = ['KRW', 'USD']
+
+def holdings_hash(holdings):
+    # 보유 구성(종목코드·수량·통화) 해시 → 가격이 바뀌어도 구성이 같으면 같은 키
+    keys = holdings['종목코드'].astype(str).str.strip().str.upper()
+    rows = sorted(zip(keys, holdings['수량'].astype(float).round(6), holdings['통화'].astype(str)))
+    return hashlib.sha256(repr(rows).encode('utf-8')).hexdigest()[:16]
+
+def _returns(prices):
+    # 일간 수익률 행렬 (가격 0 구간은 수익률 0 처리)
+    prev, cur = prices[:-1], prices[1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = np.where(prev > 0, cur / prev - 1, 0.0)
+    return np.nan_to_num(r)
+
+def compute_risk(holdings, price_matrix, fx, benchmarks=None, var_level=0.95):
+    krw_prices = to_krw_prices(holdings, price_matrix, fx)
+    krw_prices = krw_prices[krw_prices.index.dayofweek < 5]
+    values = holdings_values(holdings).reindex(krw_prices.columns).fillna(0.0)
+    values = values[values > 0]
+    # 과거 시세를 못 받은 종목은 변동성 0 으로 계산하지 않고 비중에서 제외 (결과에 따로 표시)
+    unpriced = values[krw_prices.reindex(columns=values.index).isna().all().to_numpy()]
+    values = values.drop(unpriced.index)
+    if len(krw_prices) < 3 or values.index.difference(CASH_TICKERS).empty: return None
+
+    tickers = list(values.index)
+    R = _returns(krw_prices[tickers].to_numpy(dtype=float))
+    total = float(values.sum())
+    w = values.to_numpy() / total
+
+    cov = np.atleast_2d(np.cov(R, rowvar=False))
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.where(np.outer(std, std) > 0, cov / np.outer(std, std), 0.0)
+    np.fill_diagonal(corr, np.where(std > 0, 1.0, 0.0))
+
+    port_r = R @ w
+    port_var = float(w @ cov @ w)
+    port_vol = np.sqrt(port_var * TRADING_DAYS)
+    risk_contrib = w * (cov @ w) / port_var * 100 if port_var > 0 else np.zeros_like(w)
+    var_pct = -np.percentile(port_r, (1 - var_level) * 100) * 100
+
+    betas = {}
+    fx_daily = fx.reindex(fx.index.union(krw_prices.index)).sort_index().ffill().bfill().reindex(krw_prices.index)
+    for name, (series, currency) in (benchmarks or {}).items():
+        b = series.reindex(series.index.union(krw_prices.index)).sort_index().ffill().reindex(krw_prices.index).to_numpy(dtype=float)
+        if currency == 'USD': b = b * fx_daily.to_numpy(dtype=float)
+        b_r = _returns(np.nan_to_num(b))
+        b_var = np.var(b_r, ddof=1)
+        betas[name] = float(np.cov(port_r, b_r)[0, 1] / b_var) if b_var > 0 else float('nan')
+
+    per_holding = pd.DataFrame({
+        '종목코드': tickers,
+        '비중(%)': w * 100,
+        '평가금액': values.to_numpy(),
+        '연변동성(%)': std * np.sqrt(TRADING_DAYS) * 100,
+        '위험기여도(%)': risk_contrib,
+    }).sort_values('평가금액', ascending=False, ignore_index=True)
+
+    return {
+        '연변동성(%)': port_vol * 100,
+        f'VaR {var_level:.0%} (1일, %)': var_pct,
+        f'VaR {var_level:.0%} (1일, 원)': var_pct / 100 * total,
+        '베타': betas,
+        '종목별': per_holding,
+        '공분산': pd.DataFrame(cov * TRADING_DAYS, index=tickers, columns=tickers),
+        '상관계수': pd.DataFrame(corr, index=tickers, columns=tickers),
+        '기간': (krw_prices.index[0], krw_prices.index[-1]),
+        '시세 없음': unpriced.rename('평가금액').rename_axis('종목코드').reset_index(),
+    }
@@ -0,0 +1,209 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# -----------------------------------------------------------------------------
+# 자산 배분 롤업 (계좌 x 종목명/업종/국가/유형/통화 합계)
+#  - 시세 반영 직후 groupby 한 번으로 세부 큐브(계좌 x 전 차원)를 만들고,
+#    차원별 표(계좌 x 차원값)와 계좌 합계는 큐브에서 파생
+#  - 이후 가격·수량이 바뀐 행만 델타로 반영 (np.add.at, 변경 행 수에 비례)
+#  - 대시보드 / 계좌별 상세 / 사이드바는 원본 행 대신 이 롤업을 읽음
+# -----------------------------------------------------------------------------
+ROLLUP_DIMS = ['종목명', '업종', '국가', '유형', '통화']
+KEY_COLS = ['계좌명'] + ROLLUP_DIMS
+VALUE_COLS = ['평가금액', '매수금액']
+ROW_ID_COLS = ['계좌명', '종목코드']
+HIDDEN_KEYWORDS = ['퇴직연금', 'IRP', 'DC']
+
+def is_hidden_account(name):
+    return any(k in str(name) for k in HIDDEN_KEYWORDS)
+
+def _keys_frame(df):
+    return df[KEY_COLS].fillna('기타').astype(str)
+
+class AllocationRollup:
+    def __init__(self, holdings):
+        frame = holdings.reset_index(drop=True)
+        keys = _keys_frame(frame)
+        grouped = frame[VALUE_COLS].astype(float).groupby([keys[c] for c in KEY_COLS], sort=False)
+        cube = grouped.sum()
+
+        self._row_ids = frame[ROW_ID_COLS].astype(str).reset_index(drop=True)
+        self._row_keys = keys
+        self._row_vals = frame[VALUE_COLS].to_numpy(dtype=float).copy()
+        self._codes = grouped.ngroup().to_numpy().copy()
+        self._cube_index = cube.index
+        self._cube_vals = cube.to_numpy(dtype=float).copy()
+
+        # 차원별 표: 큐브 그룹 → (계좌, 차원값) 그룹 매핑을 저장해 델타를 그대로 전파
+        # (정수 코드 조합으로 factorize → 문자열 튜플을 만들지 않음)
+        self._levels = {}
+        acct_codes = cube.index.codes[0].astype(np.int64)
+        for i, level in enumerate([None] + ROLLUP_DIMS):
+            combined = acct_codes * len(cube.index.levels[i]) + cube.index.codes[i] if level else acct_codes
+            lvl_codes, uniques = pd.factorize(combined)
+            first = np.unique(lvl_codes, return_index=True)[1]
+            arrays = [cube.index.get_level_values('계좌명')[first]]
+            if level: arrays.append(cube.index.get_level_values(level)[first])
+            lvl_index = pd.MultiIndex.from_arrays(arrays)
+            vals = np.zeros((len(lvl_index), len(VALUE_COLS)))
+            np.add.at(vals, lvl_codes, self._cube_vals)
+            self._levels[level] = [lvl_index, vals, lvl_codes]
+
+        self.accounts = self._row_ids['계좌명'].unique().tolist()
+        self.dashboard_accounts = [a for a in self.accounts if not is_hidden_account(a)]
+        self._views = {}
+
+    def __len__(self):
+        return len(self._row_vals)
+
+    def _lookup_groups(self, keys):
+        # 새 키 조합이면 큐브와 차원별 표에 그룹을 추가
+        index = pd.MultiIndex.from_frame(keys)
+        codes = self._cube_index.get_indexer(index)
+        missing = codes < 0
+        if missing.any():
+            new_groups = index[missing].unique()
+            start = len(self._cube_index)
+            self._cube_index = self._cube_index.append(new_groups)
+            self._cube_vals = np.vstack([self._cube_vals, np.zeros((len(new_groups), len(VALUE_COLS)))])
+            for level, entry in self._levels.items():
+                lvl_index, vals, lvl_codes = entry
+                arrays = [new_groups.get_level_values('계좌명')]
+                if level: arrays.append(new_groups.get_level_values(level))
+                new_lvl = pd.MultiIndex.from_arrays(arrays)
+                new_codes = lvl_index.get_indexer(new_lvl)
+                absent = new_lvl[new_codes < 0].unique()
+                if len(absent):
+                    lvl_index = lvl_index.append(absent)
+                    vals = np.vstack([vals, np.zeros((len(absent), len(VALUE_COLS)))])
+                    new_codes = lvl_index.get_indexer(new_lvl)
+                self._levels[level] = [lvl_index, vals, np.concatenate([lvl_codes, new_codes])]
+            codes[missing] = start + new_groups.get_indexer(index[missing])
+        return codes
+
+    def _apply(self, codes, deltas):
+        np.add.at(self._cube_vals, codes, deltas)
+        for lvl_index, vals, lvl_codes in self._levels.values():
+            np.add.at(vals, lvl_codes[codes], deltas)
+
+    def update(self, changes):
+        # changes: 행 위치 인덱스 + 평가금액/매수금액 (차원 열이 바뀌었으면 함께 전달)
+        if changes.empty: return self
+        rows = changes.index.to_numpy()
+        old_codes = self._codes[rows]
+        new_codes = old_codes
+        if any(c in changes.columns for c in KEY_COLS):
+            keys = self._row_keys.iloc[rows].copy()
+            for c in KEY_COLS:
+                if c in changes.columns: keys[c] = changes[c].fillna('기타').astype(str).to_numpy()
+            new_codes = self._lookup_groups(keys)
+            self._row_keys.iloc[rows] = keys.to_numpy()
+        new_vals = changes[VALUE_COLS].to_numpy(dtype=float)
+        self._apply(old_codes, -self._row_vals[rows])
+        self._apply(new_codes, new_vals)
+        self._row_vals[rows] = new_vals
+        self._codes[rows] = new_codes
+        self._views.clear()
+        return self
+
+    def apply_changes(self, holdings):
+        # 재계산된 전체 보유 테이블과 비교해 값·분류가 바뀐 행만 반영
+        frame = holdings.reset_index(drop=True)
+        if len(frame) != len(self) or not frame[ROW_ID_COLS].astype(str).equals(self._row_ids):
+            return AllocationRollup(holdings)
+        keys = _keys_frame(frame)
+        vals = frame[VALUE_COLS].to_numpy(dtype=float)
+        # 열 단위로 문자열 배열끼리 비교 (2차원 object 배열로 꺼내면 행마다 파이썬 문자열이 생겨 전체 재생성보다 느림)
+        key_changed = np.zeros(len(frame), dtype=bool)
+        for c in KEY_COLS: key_changed |= (keys[c] != self._row_keys[c]).to_numpy(dtype=bool)
+        changed = key_changed | (vals != self._row_vals).any(axis=1)
+        if not changed.any(): return self
+        changes = frame.loc[changed, VALUE_COLS]
+        if key_changed.any(): changes = changes.join(keys.loc[changed])
+        return self.update(changes)
+
+    def account_totals(self, col='평가금액'):
+        lvl_index, vals, _ = self._levels[None]
+        return pd.Series(vals[:, VALUE_COLS.index(col)], index=lvl_index.get_level_values(0))
+
+    def total(self, col='평가금액', accounts=None):
+        totals = self.account_totals(col)
+        return float(totals[totals.index.isin(accounts)].sum() if accounts is not None else totals.sum())
+
+    def by(self, dim, accounts=None, col='평가금액'):
+        # 선택 계좌들의 차원값별 합계 (create_pie 에 바로 넘길 수 있는 형태)
+        view_key = (dim, tuple(accounts) if accounts is not None else None, col)
+        if view_key not in self._views:
+            lvl_index, vals, _ = self._levels[dim]
+            mask = lvl_index.get_level_values(0).isin(accounts) if accounts is not None else np.ones(len(lvl_index), dtype=bool)
+            s = pd.Series(vals[mask, VALUE_COLS.index(col)], index=lvl_index.get_level_values(1)[mask])
+            s = s.groupby(level=0, sort=False).sum()
+            s = s[s.round(6) != 0]
+            self._views[view_key] = s.rename_axis(dim).rename(col).reset_index()
+        return self._views[view_key]
+
+    def table(self, dim=None):
+        # 계좌 x 차원값 합계 표 (dim=None 이면 계좌별 합계) — 내보내기용
+        lvl_index, vals, _ = self._levels[dim]
+        names = ['계좌명'] + ([dim] if dim else [])
+        frame = pd.DataFrame(vals, columns=VALUE_COLS, index=lvl_index.set_names(names)).reset_index()
+        return frame[frame[VALUE_COLS].round(6).ne(0).any(axis=1)].reset_index(drop=True)
+
+def refresh_rollup(rollup, holdings):
+    return AllocationRollup(holdings) if rollup is None else rollup.apply_changes(holdings)
+
+# -----------------------------------------------------------------------------
+# 합성 데이터 벤치마크: python rollup.py [행 수]
+# -----------------------------------------------------------------------------
+def _synthetic_holdings(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    n_accounts, n_tickers = 20, max(n_rows // 20, 1)
+    tickers = np.array([f"T{i:06d}" for i in range(n_tickers)])
+    sectors = np.array(['반도체', 'IT', '금융', '헬스케어', '원자재', '에너지', '소비재', '현금'])
+    t_idx = rng.integers(0, n_tickers, n_rows)
+    eval_vals = rng.uniform(1e4, 1e7, n_rows)
+    return pd.DataFrame({
+        '계좌명': np.array([f"계좌{i:02d}" for i in range(n_accounts)])[rng.integers(0, n_accounts, n_rows)],
+        '종목코드': tickers[t_idx],
+        '종목명': tickers[t_idx],
+        '업종': sectors[t_idx % len(sectors)],
+        '국가': np.where(t_idx % 2 == 0, '한국', '미국'),
+        '유형': np.where(t_idx % 3 == 0, 'ETF', '개별주식'),
+        '통화': np.where(t_idx % 2 == 0, 'KRW', 'USD'),
+        '평가금액': eval_vals,
+        '매수금액': eval_vals * rng.uniform(0.7, 1.3, n_rows),
+    })
+
+def _benchmark(n_rows=1_000_000):
+    # 앱과 같은 경로(refresh_rollup 에 재계산된 전체 표 전달)로 측정 → 변경 행 탐지 비용 포함
+    df = _synthetic_holdings(n_rows)
+    t0 = time.perf_counter()
+    rollup = AllocationRollup(df)
+    print(f"rows={n_rows:,}  full build: {time.perf_counter() - t0:8.4f}s")
+
+    rng = np.random.default_rng(1)
+    for n_changed in [10, 1_000, 10_000, 100_000]:
+        rows = rng.choice(n_rows, n_changed, replace=False)
+        df = df.copy()
+        df.loc[rows, VALUE_COLS] = df.loc[rows, VALUE_COLS].to_numpy() * rng.uniform(0.95, 1.05, (n_changed, 1))
+        t0 = time.perf_counter()
+        rollup = refresh_rollup(rollup, df)
+        print(f"changed={n_changed:>7,}  refresh_rollup: {time.perf_counter() - t0:8.4f}s")
+
+    rows = rng.choice(n_rows, 1_000, replace=False)
+    df = df.copy()
+    df.loc[rows, '업종'] = '재분류'
+    t0 = time.perf_counter()
+    rollup = refresh_rollup(rollup, df)
+    print(f"changed=  1,000  refresh_rollup (업종 변경): {time.perf_counter() - t0:8.4f}s")
+
+    assert np.isclose(rollup.total('평가금액'), df['평가금액'].sum())
+    assert np.isclose(rollup.by('업종').set_index('업종')['평가금액'].sum(), df['평가금액'].sum())
+    t0 = time.perf_counter()
+    for dim in ROLLUP_DIMS: rollup.by(dim, rollup.dashboard_accounts)
+    print(f"views (5 dims, all accounts): {time.perf_counter() - t0:8.4f}s")
+
+if __name__ == '__main__':
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from history_store import DATA_DIR, atomic_write
+
+# -----------------------------------------------------------------------------
+# 평가 결과 스냅샷 (통합문서 내용 해시 + 시세 시각 기준, Parquet)
+#  - 파일명: <통합문서해시>_<YYYYMMDDHHMMSS>.parquet (+ 같은 이름의 .json 메타)
+#  - 같은 통합문서를 다시 올리면 최신 스냅샷을 바로 불러와 재계산을 생략 (시세가 오래됐으면 재계산)
+#  - 같은 세션의 직전 업로드 스냅샷과 비교해 종목별 수량 변화 / 가격 변동 / 손익 요인 분해 제공
+#    (폴더는 모든 세션이 공유하므로 비교 대상은 세션 상태에 기록된 이름만 사용)
+# -----------------------------------------------------------------------------
+SNAPSHOT_DIR = DATA_DIR / 'snapshots'
+KEEP_PER_WORKBOOK = 5
+ROW_KEY = ['계좌명', '종목코드']
+
+def workbook_hash(data):
+    return hashlib.sha256(data).hexdigest()[:20]
+
+def _parse_name(stem):
+    wb_hash, ts = stem.rsplit('_', 1)
+    return wb_hash, pd.Timestamp(ts)
+
+def list_snapshots():
+    # (이름, 통합문서해시, 시세시각) 목록, 최신순
+    if not SNAPSHOT_DIR.exists(): return []
+    items = [(p.stem, *_parse_name(p.stem)) for p in SNAPSHOT_DIR.glob('*.parquet')]
+    return sorted(items, key=lambda x: x[2], reverse=True)
+
+def latest_snapshot(wb_hash, since=None):
+    # since 이후 시세로 저장된 것만 (그보다 오래된 스냅샷은 현재 평가로 쓰지 않음)
+    return next((name for name, h, ts in list_snapshots() if h == wb_hash and (since is None or ts >= since)), None)
+
+def snapshot_exists(name):
+    return (SNAPSHOT_DIR / f"{name}.parquet").exists()
+
+def save_snapshot(wb_hash, portfolio_data, price_ts, meta):
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    name = f"{wb_hash}_{price_ts:%Y%m%d%H%M%S}"
+    frame = pd.concat(portfolio_data.values(), ignore_index=True)
+    # 엑셀에서 읽은 혼합형(숫자/문자) 열은 문자열로 통일해야 Parquet 로 저장 가능
+    for c in frame.columns[frame.dtypes == object]:
+        frame[c] = frame[c].where(frame[c].isna(), frame[c].astype(str))
+    meta = dict(meta, sheets=list(portfolio_data.keys()), price_ts=price_ts.isoformat())
+    # 메타를 먼저 쓰고 본문을 마지막에 교체 → 목록(.parquet 기준)에 보이는 스냅샷은 항상 메타가 있음
+    text = json.dumps(meta, ensure_ascii=False)
+    atomic_write(SNAPSHOT_DIR / f"{name}.json", lambda tmp: tmp.write_text(text, encoding='utf-8'))
+    atomic_write(SNAPSHOT_DIR / f"{name}.parquet", lambda tmp: frame.to_parquet(tmp, compression='zstd', index=False))
+
+    for old_name, h, _ in [s for s in list_snapshots() if s[1] == wb_hash][KEEP_PER_WORKBOOK:]:
+        for ext in ['.parquet', '.json']: (SNAPSHOT_DIR / f"{old_name}{ext}").unlink(missing_ok=True)
+    return name
+
+def load_snapshot(name):
+    frame = pd.read_parquet(SNAPSHOT_DIR / f"{name}.parquet")
+    meta_path = SNAPSHOT_DIR / f"{name}.json"
+    meta = json.loads(meta_path.read_text(encoding='utf-8')) if meta_path.exists() else {}
+    sheets = meta.get('sheets') or list(dict.fromkeys(frame['계좌명']))
+    portfolio_data = {s: frame[frame['계좌명'] == s].reset_index(drop=True) for s in sheets}
+    return portfolio_data, meta
+
+def _by_holding(frame):
+    frame = frame.assign(종목코드=frame['종목코드'].astype(str).str.strip().str.upper())
+    return frame.groupby(ROW_KEY, sort=False).agg(
+        종목명=('종목명', 'first'), 수량=('수량', 'sum'), 현재가=('현재가', 'first'), 평가금액=('평가금액', 'sum'))
+
+def diff_snapshots(old_frame, new_frame):
+    # 손익 요인 분해: 가격효과 = 이전수량 x 단위평가액 변화, 수량효과 = 나머지 (합 = 평가금액 변화)
+    old, new = _by_holding(old_frame), _by_holding(new_frame)
+    d = old.join(new, how='outer', lsuffix='_이전', rsuffix='_현재')
+    d['종목명'] = d['종목명_현재'].fillna(d['종목명_이전'])
+    for c in ['수량', '현재가', '평가금액']:
+        d[[f'{c}_이전', f'{c}_현재']] = d[[f'{c}_이전', f'{c}_현재']].astype(float).fillna(0.0)
+
+    q0, q1 = d['수량_이전'].to_numpy(), d['수량_현재'].to_numpy()
+    v0, v1 = d['평가금액_이전'].to_numpy(), d['평가금액_현재'].to_numpy()
+    held = (q0 != 0) & (q1 != 0)
+    unit0 = pd.Series(v0).div(pd.Series(q0).where(q0 != 0)).fillna(0).to_numpy()
+    unit1 = pd.Series(v1).div(pd.Series(q1).where(q1 != 0)).fillna(0).to_numpy()
+    d['수량변화'] = q1 - q0
+    d['가격변동(%)'] = (d['현재가_현재'] / d['현재가_이전'].where(d['현재가_이전'] > 0) - 1).fillna(0) * 100
+    d['가격효과'] = np.where(held, q0 * (unit1 - unit0), 0.0)
+    d['수량효과'] = (v1 - v0) - d['가격효과']
+    d['평가금액 변화'] = v1 - v0
+    d['상태'] = '유지'
+    d.loc[(q0 == 0) & (q1 != 0), '상태'] = '신규'
+    d.loc[(q0 != 0) & (q1 == 0), '상태'] = '청산'
+    d.loc[held & (q0 != q1), '상태'] = '수량변경'
+    cols = ['종목명', '상태', '수량_이전', '수량_현재', '수량변화', '현재가_이전', '현재가_현재', '가격변동(%)', '평가금액_이전', '평가금액_현재', '가격효과', '수량효과', '평가금액 변화']
+    return d[cols].reset_index()